@@ -1,20 +1,492 @@
-import rasterio
 import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta, date
-from rasterio.mask import mask
-import fiona
-import imageio
+import importlib
 import os
-import matplotlib
-import matplotlib.pyplot as plt
-import shutil
-import geopandas as gpd
-from rasterio.warp import calculate_default_transform, reproject, Resampling
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import hashlib
+import json
+import re
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+###the geo and plotting modules are heavy to import, they are only loaded when a feature first uses them,
+###so that e.g. getCollections and getTimeSeries start quickly
+class lazyModule:
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if attr in ('name', 'module'):
+            raise AttributeError(attr)
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        try:
+            return getattr(self.module, attr)
+        except AttributeError:
+            pass
+        ###submodules, e.g. rasterio.warp, are imported on first access as well
+        submodule = '{}.{}'.format(self.name, attr)
+        try:
+            return importlib.import_module(submodule)
+        except ModuleNotFoundError as e:
+            ###a missing dependency of an existing submodule is still reported as such
+            if e.name != submodule:
+                raise
+            raise AttributeError(attr)
+
+    def __repr__(self):
+        return "<lazy module '{}'>".format(self.name)
+
+rasterio = lazyModule('rasterio')
+fiona = lazyModule('fiona')
+imageio = lazyModule('imageio')
+matplotlib = lazyModule('matplotlib')
+backend_agg = lazyModule('matplotlib.backends.backend_agg')
+gpd = lazyModule('geopandas')
+xr = lazyModule('xarray')
+dask = lazyModule('dask')
+da = lazyModule('dask.array')
 
 ### draft for adampy python package
 
+###instrumentation: every callback in metrics_callbacks receives the events as dictionaries, e.g.
+###{'type': 'stage', 'stage': 'fetch', 'seconds': 0.3, 'component': 'getImage'} or {'type': 'counter', 'name': 'bytes_transferred', 'value': 1024}
+metrics_callbacks = []
+
+def add_metrics_callback(callback):
+    metrics_callbacks.append(callback)
+    return callback
+
+def remove_metrics_callback(callback):
+    metrics_callbacks.remove(callback)
+
+def emit_metric(event):
+    for callback in list(metrics_callbacks):
+        callback(event)
+
+@contextmanager
+def timed_stage(stage, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics_callbacks:
+            emit_metric(dict(labels, type='stage', stage=stage, seconds=time.perf_counter() - start))
+
+def count_metric(name, value = 1, **labels):
+    if metrics_callbacks:
+        emit_metric(dict(labels, type='counter', name=name, value=value))
+
+
+class metricsCollector:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+
+    def __call__(self, event):
+        labels = tuple(sorted((k, str(v)) for k, v in event.items() if k not in ('type', 'stage', 'seconds', 'name', 'value')))
+        with self.lock:
+            if event['type'] == 'stage':
+                key = (event['stage'], labels)
+                count, total, slowest = self.stages.get(key, (0, 0.0, 0.0))
+                self.stages[key] = (count + 1, total + event['seconds'], max(slowest, event['seconds']))
+            else:
+                key = (event['name'], labels)
+                self.counters[key] = self.counters.get(key, 0) + event['value']
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+
+    def stats(self):
+        with self.lock:
+            stages = [dict(labels, stage=stage, count=count, seconds=total, max_seconds=slowest)
+                      for (stage, labels), (count, total, slowest) in sorted(self.stages.items())]
+            counters = [dict(labels, name=name, value=value) for (name, labels), value in sorted(self.counters.items())]
+        return {'stages': stages, 'counters': counters}
+
+    ###Prometheus text exposition format
+    def to_prometheus(self, prefix = 'adampy'):
+        def label_text(labels):
+            return '{' + ','.join('{}="{}"'.format(k, v.replace('"', '\\"')) for k, v in labels) + '}' if labels else ''
+
+        lines = []
+        with self.lock:
+            if self.stages:
+                lines.append('# TYPE {}_stage_seconds summary'.format(prefix))
+            for (stage, labels), (count, total, slowest) in sorted(self.stages.items()):
+                text = label_text((('stage', stage),) + labels)
+                lines.append('{}_stage_seconds_sum{} {}'.format(prefix, text, total))
+                lines.append('{}_stage_seconds_count{} {}'.format(prefix, text, count))
+            for name in sorted(set(name for name, _ in self.counters)):
+                lines.append('# TYPE {}_{}_total counter'.format(prefix, name))
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append('{}_{}_total{} {}'.format(prefix, name, label_text(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+def enable_metrics():
+    return add_metrics_callback(metricsCollector())
+
+class tileCache:
+    def __init__(self, directory = 'adam_cache', max_size = 1024**3, ttl = 3600, nrt_collections = ('NRT',)):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.nrt_collections = nrt_collections
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    ###the key is built from the normalized request parameters, the token is left out so that it can be refreshed without invalidating the cache
+    def key(self, url):
+        parts = urlsplit(url)
+        params = []
+        for name, value in parse_qsl(parts.query):
+            if name.lower() == 'token':
+                continue
+            params.append((name.lower(), re.sub(r'[-+.\w]+', normalize_number, value)))
+        request = '{}{}?{}'.format(parts.netloc, parts.path, '&'.join('{}={}'.format(name, value) for name, value in sorted(params)))
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def is_nrt(self, url):
+        collection = dict((name.lower(), value) for name, value in parse_qsl(urlsplit(url).query)).get('coverageid', '')
+        return any(pattern in collection for pattern in self.nrt_collections)
+
+    def get(self, url):
+        fname = os.path.join(self.directory, self.key(url))
+        try:
+            stat = os.stat(fname)
+            if self.ttl is not None and self.is_nrt(url) and time.time() - stat.st_mtime > self.ttl:
+                raise FileNotFoundError(fname)
+            with open(fname, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            count_metric('cache_misses')
+            return None
+        ###the access time keeps track of the least recently used entries, the modification time of the age.
+        ###The entry may have been evicted in the meantime, the content was read already.
+        try:
+            os.utime(fname, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.hits += 1
+        count_metric('cache_hits')
+        return content
+
+    def put(self, url, content):
+        fname = os.path.join(self.directory, self.key(url))
+        tmp_fname = '{}.{}.tmp'.format(fname, threading.get_ident())
+        with open(tmp_fname, 'wb') as f:
+            f.write(content)
+        with self.lock:
+            ###an entry that is replaced, e.g. an expired NRT tile, no longer counts towards the size
+            try:
+                old_size = os.stat(fname).st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_fname, fname)
+            self.size += len(content) - old_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        entries = sorted((entry.stat().st_atime, entry.stat().st_size, entry.path) for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith('.tmp'))
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def clear(self):
+        with self.lock:
+            for entry in os.scandir(self.directory):
+                if entry.is_file():
+                    os.remove(entry.path)
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': self.size}
+
+
+def normalize_number(match):
+    try:
+        return repr(float(match.group(0)))
+    except ValueError:
+        return match.group(0)
+
+
+###cache shared by all getters, set it with enable_cache
+default_cache = None
+
+def enable_cache(directory = 'adam_cache', max_size = 1024**3, ttl = 3600, nrt_collections = ('NRT',)):
+    global default_cache
+    default_cache = tileCache(directory, max_size, ttl, nrt_collections)
+    return default_cache
+
+def disable_cache():
+    global default_cache
+    default_cache = None
+
+
+###endpoints are given without scheme and served over https, a scheme can be given for other servers, e.g. 'http://localhost:8000'
+def wcs_url(endpoint):
+    if '://' in endpoint:
+        return '{}/wcs'.format(endpoint)
+    return 'https://{}/wcs'.format(endpoint)
+
+###all classes share one pooled keep-alive session with default timeouts and retries, see configure_session
+class countingRetry(Retry):
+    def increment(self, *args, **kwargs):
+        count_metric('retries', component='http')
+        return super().increment(*args, **kwargs)
+
+class httpSession(requests.Session):
+    def __init__(self, timeout = (10, 300), retries = 3, backoff = 0.5, pool_size = 16):
+        super().__init__()
+        self.timeout = timeout
+        ###failed requests and 429/5xx answers are retried with exponential backoff, the last answer is returned
+        retry = countingRetry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=('GET', 'HEAD'), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+default_session = None
+session_lock = threading.Lock()
+
+def configure_session(timeout = (10, 300), retries = 3, backoff = 0.5, pool_size = 16):
+    ###timeout is given in seconds, either one value or a (connect, read) pair
+    global default_session
+    with session_lock:
+        previous = default_session
+        default_session = httpSession(timeout, retries, backoff, pool_size)
+    if previous is not None:
+        previous.close()
+    return default_session
+
+def get_session():
+    global default_session
+    if default_session is None:
+        with session_lock:
+            if default_session is None:
+                default_session = httpSession()
+    return default_session
+
+def wcs_request(url, cache = None, session = None, component = 'None'):
+    if session is None:
+        session = get_session()
+    if cache is None:
+        cache = default_cache
+    if cache:
+        content = cache.get(url)
+        if content is not None:
+            return content
+
+    with timed_stage('fetch', component=component):
+        result = session.get(url)
+    count_metric('bytes_transferred', len(result.content), component=component)
+    ###errors are not cached
+    if cache and result.status_code == 200 and b'ExceptionReport' not in result.content[:1024]:
+        cache.put(url, result.content)
+    return result.content
+
+
+###coverage availability index: collection -> time extent, spatial extent and available timestamps, built from
+###GetCapabilities and DescribeCoverage and persisted as JSON. Entries older than ttl seconds are described
+###again on their next use, so the index is refreshed one collection at a time.
+def parse_capabilities(xml_data):
+    tree = ET.fromstring(xml_data)
+    return sorted(i.text for i in tree.iter('{http://www.opengis.net/wcs/2.0}CoverageId'))
+
+def parse_coverage_description(xml_data):
+    ###the envelope gives the spatial and time extent, the coefficients of the time axis the offsets of the
+    ###available timestamps from the start of the time extent, as in the time series responses
+    tree = ET.fromstring(xml_data)
+    envelope = next(tree.iter('{http://www.opengis.net/gml/3.2}Envelope'))
+    labels = [label.lower() for label in envelope.get('axisLabels', 'Lat Long unix').split()]
+    lower = [float(v) for v in envelope.find('{http://www.opengis.net/gml/3.2}lowerCorner').text.split()]
+    upper = [float(v) for v in envelope.find('{http://www.opengis.net/gml/3.2}upperCorner').text.split()]
+
+    lat_axis = next((i for i, label in enumerate(labels) if label.startswith('lat')), 0)
+    long_axis = next((i for i, label in enumerate(labels) if label.startswith('lon')), 1)
+    time_axis = next((i for i, label in enumerate(labels) if label in ('unix', 'time', 'ansi', 'date')), None)
+
+    description = {'bbox': [lower[long_axis], lower[lat_axis], upper[long_axis], upper[lat_axis]],
+                   'time_extent': None, 'timestamps': None}
+    if time_axis is not None:
+        description['time_extent'] = [int(lower[time_axis]), int(upper[time_axis])]
+        for axis in tree.iter('{http://www.opengis.net/gml/3.3/rgrid}GeneralGridAxis'):
+            spanned = axis.find('{http://www.opengis.net/gml/3.3/rgrid}gridAxesSpanned')
+            coefficients = axis.find('{http://www.opengis.net/gml/3.3/rgrid}coefficients')
+            if coefficients is not None and coefficients.text and (spanned is None or spanned.text.lower() == labels[time_axis]):
+                offsets = np.array(coefficients.text.split(), dtype=np.int64)
+                description['timestamps'] = (offsets + int(lower[time_axis])).tolist()
+    return description
+
+def parse_time_range(time_t):
+    ###'start,end' adampy time strings to seconds since 1970, a single timestamp gives an empty range
+    bounds = [np.datetime64(t.strip().rstrip('Z'), 's').astype(np.int64) for t in str(time_t).split(',')]
+    return int(bounds[0]), int(bounds[-1])
+
+class coverageIndex:
+    ###requests for collections or dates beyond what the index knows describe the collection again, at most
+    ###every min_refresh seconds, so that newly published data is found before the ttl expires
+    def __init__(self, endpoint, path = 'adam_index.json', ttl = 86400, min_refresh = 60):
+        self.endpoint = endpoint
+        self.path = path
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self.lock = threading.RLock()
+        self.index = {'capabilities': None, 'updated': 0, 'collections': {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                stored = json.load(f)
+            if stored.get('endpoint') == endpoint:
+                self.index = stored['index']
+
+    def save(self):
+        tmp_path = '{}.{}.tmp'.format(self.path, threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump({'endpoint': self.endpoint, 'index': self.index}, f)
+        os.replace(tmp_path, self.path)
+
+    def stale(self, updated):
+        return self.ttl is not None and time.time() - updated > self.ttl
+
+    def collections(self, refresh = False):
+        with self.lock:
+            if refresh or self.index['capabilities'] is None or self.stale(self.index['updated']):
+                url = '{}?service=WCS&Request=GetCapabilities'.format(wcs_url(self.endpoint))
+                with timed_stage('index', component='coverageIndex'):
+                    capabilities = parse_capabilities(get_session().get(url).text)
+                ###descriptions of collections that are still offered are kept
+                self.index['collections'] = dict((name, entry) for name, entry in self.index['collections'].items() if name in capabilities)
+                self.index['capabilities'] = capabilities
+                self.index['updated'] = time.time()
+                self.save()
+            return list(self.index['capabilities'])
+
+    def describe(self, collection):
+        url = '{}?service=WCS&Request=DescribeCoverage&version=2.0.0&CoverageId={}'.format(wcs_url(self.endpoint), collection)
+        with timed_stage('index', component='coverageIndex'):
+            content = get_session().get(url).content
+            try:
+                description = parse_coverage_description(content)
+            except (ET.ParseError, StopIteration, AttributeError, ValueError):
+                ###collections that cannot be described are treated as available everywhere
+                description = {'bbox': None, 'time_extent': None, 'timestamps': None}
+        description['updated'] = time.time()
+        return description
+
+    def coverage(self, collection, refresh = False):
+        ###returns the description of a collection or None if the endpoint does not offer it
+        if collection not in self.collections():
+            if time.time() - self.index['updated'] < self.min_refresh or collection not in self.collections(refresh=True):
+                return None
+        with self.lock:
+            entry = self.index['collections'].get(collection)
+        if refresh or entry is None or self.stale(entry['updated']):
+            entry = self.describe(collection)
+            with self.lock:
+                self.index['collections'][collection] = entry
+                self.save()
+        return entry
+
+    def refresh(self, collections = None, max_workers = 4):
+        ###describes the given collections (default: those already in the index) again, concurrently
+        if collections is None:
+            collections = list(self.index['collections'])
+        self.collections(refresh=True)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda collection: self.coverage(collection, refresh=True), collections))
+
+    def coverage_for_range(self, collection, time_t):
+        ###describes the collection again if time_t ends after the last known timestamp
+        entry = self.coverage(collection)
+        if entry is None or time.time() - entry['updated'] < self.min_refresh:
+            return entry
+        known_end = None
+        if entry['timestamps']:
+            known_end = max(entry['timestamps'])
+        elif entry['time_extent'] is not None:
+            known_end = entry['time_extent'][1]
+        if known_end is not None and parse_time_range(time_t)[1] > known_end:
+            entry = self.coverage(collection, refresh=True)
+        return entry
+
+    def available_times(self, collection, time_t):
+        ###timestamps with data within time_t as seconds since 1970, None if they are not known
+        entry = self.coverage_for_range(collection, time_t)
+        if entry is None:
+            return []
+        if entry['timestamps'] is None:
+            return None
+        start, end = parse_time_range(time_t)
+        timestamps = np.array(entry['timestamps'], dtype=np.int64)
+        return timestamps[(timestamps >= start) & (timestamps <= end)].tolist()
+
+    def has_data(self, collection, time_t, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180):
+        entry = self.coverage_for_range(collection, time_t)
+        if entry is None:
+            return False
+        if entry['bbox'] is not None:
+            west, south, east, north = entry['bbox']
+            if float(min_long) > east or float(max_long) < west or float(min_lat) > north or float(max_lat) < south:
+                return False
+        if entry['time_extent'] is not None:
+            start, end = parse_time_range(time_t)
+            if end < entry['time_extent'][0] or start > entry['time_extent'][1]:
+                return False
+        times = self.available_times(collection, time_t)
+        return times is None or len(times) > 0
+
+default_index = None
+
+def enable_index(endpoint, path = 'adam_index.json', ttl = 86400, min_refresh = 60):
+    global default_index
+    default_index = coverageIndex(endpoint, path, ttl, min_refresh)
+    return default_index
+
+def disable_index():
+    global default_index
+    default_index = None
+
+def resolve_index(index, endpoint):
+    ###index = None uses the default index if it was built for the same endpoint, index = False disables the lookups
+    if index is None:
+        index = default_index
+        if index is not None and index.endpoint != endpoint:
+            return None
+    return index or None
+
+
 class getEndpoints:
     def __init__(self, username, password):
         self.username = user
@@ -26,27 +498,25 @@ class getEndpoints:
         return endpoints_list
 
 class getCollections:
-    def __init__(self,endpoint):
+    def __init__(self,endpoint, index = None):
         self.endpoint = endpoint
+        self.index = index
 
     ##this function shouldl return a list of all available colletions given endpoint. It can use the class getCapabilites
     def get_data(self):
-        url = 'https://{}/wcs?service=WCS&Request=GetCapabilities'.format(self.endpoint)
-        result = requests.get(url)
+        index = resolve_index(self.index, self.endpoint)
+        if index is not None:
+            return index.collections()
 
-        xml_data = result.text
-
-        tree = ET.fromstring(xml_data)
+        url = '{}?service=WCS&Request=GetCapabilities'.format(wcs_url(self.endpoint))
+        result = get_session().get(url)
 
-        collection_list = []
-
-        for i in tree.iter('{http://www.opengis.net/wcs/2.0}CoverageId'):
-            collection_list.append(i.text)
+        xml_data = result.text
 
-        return sorted(collection_list)
+        return parse_capabilities(xml_data)
 
 class getImage:
-    def __init__(self, endpoint, collection, time_t, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180, token = 'None', geometry = 'None', masking = False, fname = 'image.tif', mgrs_tile = 'None', scale = 1):
+    def __init__(self, endpoint, collection, time_t, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180, token = 'None', geometry = 'None', masking = False, fname = 'None', mgrs_tile = 'None', scale = 1, cache = None, index = None):
         self.endpoint = endpoint
         self.collection = collection
         #self.geometry = geometry
@@ -61,23 +531,29 @@ class getImage:
         self.fname = fname
         self.mgrs_tile = mgrs_tile
         self.scale = scale
+        self.cache = cache
+        self.index = index
         #self.output_format = output_format
 
     def get_data(self):
 
+        index = resolve_index(self.index, self.endpoint)
+        if index is not None and not index.has_data(self.collection, self.time_t, self.min_lat, self.max_lat, self.min_long, self.max_long):
+            raise ValueError('No data was available for {} at {} in the requested area'.format(self.collection, self.time_t))
+
         if self.masking == True:
             df = gpd.read_file(self.geometry)
             geom = df['geometry'][0]
             if self.mgrs_tile != 'None':
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(self.endpoint,self.time_t,self.collection, geom.bounds[1]-1, geom.bounds[3]+1, geom.bounds[0]-1, geom.bounds[2]+1, self.token, self.scale,self.mgrs_tile)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(wcs_url(self.endpoint),self.time_t,self.collection, geom.bounds[1]-1, geom.bounds[3]+1, geom.bounds[0]-1, geom.bounds[2]+1, self.token, self.scale,self.mgrs_tile)
             else:
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}".format(self.endpoint,self.time_t,self.collection, geom.bounds[1], geom.bounds[3], geom.bounds[0], geom.bounds[2], self.token, self.scale)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}".format(wcs_url(self.endpoint),self.time_t,self.collection, geom.bounds[1], geom.bounds[3], geom.bounds[0], geom.bounds[2], self.token, self.scale)
 
         else:
             if self.mgrs_tile != 'None':
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale, self.mgrs_tile)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(wcs_url(self.endpoint),self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale, self.mgrs_tile)
             else:
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}".format(wcs_url(self.endpoint),self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale)
 
         # if self.mgrs_tile != 'None':
         #     url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&mgrs_tile={}&filter=false".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.mgrs_tile)
@@ -85,53 +561,86 @@ class getImage:
         #     url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&CoverageId={}&token={}&mgrs_tile={}&filter=false".format(self.endpoint,self.time_t,self.collection, self.token, self.mgrs_tile)
 
         #print(url)
-        result = requests.get(url)
-        with open(self.fname, 'wb') as f:
-            f.write(result.content)
-            f.close()
-
-
-        #if image is sentinel2 tiled transform to EPSG:4326
-
-
-        src = rasterio.open(self.fname)
-        out_image = src.read(1)
-        out_image = out_image.astype(np.float32)
-        out_image[out_image == src.nodata] = 'nan'
-        out_meta = src.meta.copy()
-        out_meta.update({"bbox": src.bounds})
-
-        if 'CAMS' in self.collection:
-            out_meta.update({"offset": src.offsets[0],
-                            "scale": src.scales[0]})
-
-        if self.masking == True:
-            with fiona.open(self.geometry, "r") as shapefile:
-                features = [feature["geometry"] for feature in shapefile]
-            out_image, out_transform = mask(src, features, crop=True)
-            out_image = out_image.astype(np.float32)
-            out_image[out_image == src.nodata] = 'nan'
-            out_image = out_image[0,:,:]
-            out_meta = src.meta.copy()
-
-            if 'CAMS' in self.collection:
-                out_meta.update({"driver": "GTiff",
-                                "height": out_image.shape[0],
-                                "width": out_image.shape[1],
-                                "transform": out_transform,
-                                "offset": src.offsets[0],
-                                "scale": src.scales[0]})
-            else:
-                out_meta.update({"driver": "GTiff",
-                                "height": out_image.shape[0],
-                                "width": out_image.shape[1],
-                                "transform": out_transform})
+        content = wcs_request(url, self.cache, component='getImage')
+        if self.fname != 'None':
+            with timed_stage('write', component='getImage'):
+                with open(self.fname, 'wb') as f:
+                    f.write(content)
+
+        ###the response is decoded in memory, the file is only written when fname is given
+        with rasterio.io.MemoryFile(content) as memfile:
+            with memfile.open() as src:
+                with timed_stage('decode', component='getImage'):
+                    out_image = src.read(1, out_dtype=np.float32)
+                    out_image[out_image == src.nodata] = 'nan'
+                    out_meta = src.meta.copy()
+                    out_meta.update({"bbox": src.bounds})
+
+                    if 'CAMS' in self.collection:
+                        out_meta.update({"offset": src.offsets[0],
+                                        "scale": src.scales[0]})
+
+                if self.masking == True:
+                    with timed_stage('mask', component='getImage'):
+                        with fiona.open(self.geometry, "r") as shapefile:
+                            features = [feature["geometry"] for feature in shapefile]
+                        out_image, out_transform = rasterio.mask.mask(src, features, crop=True)
+                        out_image = out_image.astype(np.float32)
+                        out_image[out_image == src.nodata] = 'nan'
+                        out_image = out_image[0,:,:]
+                        out_meta = src.meta.copy()
+
+                        if 'CAMS' in self.collection:
+                            out_meta.update({"driver": "GTiff",
+                                            "height": out_image.shape[0],
+                                            "width": out_image.shape[1],
+                                            "transform": out_transform,
+                                            "offset": src.offsets[0],
+                                            "scale": src.scales[0]})
+                        else:
+                            out_meta.update({"driver": "GTiff",
+                                            "height": out_image.shape[0],
+                                            "width": out_image.shape[1],
+                                            "transform": out_transform})
 
         return out_image, out_meta
 
 
+###Sentinel-2 tiles follow the MGRS grid: UTM zone, latitude band and 100 km square
+MGRS_BANDS = 'CDEFGHJKLMNPQRSTUVWX'
+MGRS_COLUMNS = ('ABCDEFGH', 'JKLMNPQR', 'STUVWXYZ')
+MGRS_ROWS = 'ABCDEFGHJKLMNPQRSTUV'
+MGRS_AUTO_MAX_EXTENT = 10
+
+def mgrs_tiles_for_bbox(min_lat, max_lat, min_long, max_long, step = 0.05):
+    ###returns the MGRS tile ids (e.g. '32TLR') touched by the bounding box, sampled every `step` degrees.
+    ###The special zones around Norway and Svalbard are not handled.
+    lats = np.linspace(max(min_lat, -80), min(max_lat, 84), int(np.ceil((max_lat - min_lat) / step)) + 1)
+    longs = np.linspace(min_long, max_long, int(np.ceil((max_long - min_long) / step)) + 1)
+    longs, lats = [a.ravel() for a in np.meshgrid(longs, lats)]
+    zones = np.clip(np.floor((longs + 180) / 6).astype(int) + 1, 1, 60)
+    bands = np.clip(np.floor((lats + 80) / 8).astype(int), 0, len(MGRS_BANDS) - 1)
+
+    tiles = set()
+    for zone in np.unique(zones):
+        for north in (True, False):
+            selection = (zones == zone) & ((lats >= 0) == north)
+            if not selection.any():
+                continue
+            utm_crs = 'EPSG:{}{:02d}'.format(326 if north else 327, zone)
+            eastings, northings = rasterio.warp.transform('EPSG:4326', utm_crs, longs[selection], lats[selection])
+            columns = MGRS_COLUMNS[(zone - 1) % 3]
+            row_offset = 5 if zone % 2 == 0 else 0
+            for easting, northing, band in zip(eastings, northings, bands[selection]):
+                column = min(max(int(easting // 100000) - 1, 0), 7)
+                row = (int(northing // 100000) + row_offset) % 20
+                tiles.add('{:02d}{}{}{}'.format(zone, MGRS_BANDS[band], columns[column], MGRS_ROWS[row]))
+    return sorted(tiles)
+
 class getImageSentinel2:
-    def __init__(self, endpoint, collection, time_t, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180, token = 'None', geometry = 'None', masking = False, fname = 'image.tif', mgrs_tile = 'None', scale = 1):
+    ###mgrs_tile can be a single tile id, a list of tile ids or 'auto' to derive the tiles from the bounding box.
+    ###Several tiles are fetched concurrently by max_workers threads and mosaicked into a single EPSG:4326 image.
+    def __init__(self, endpoint, collection, time_t, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180, token = 'None', geometry = 'None', masking = False, fname = 'None', mgrs_tile = 'None', scale = 1, cache = None, index = None, max_workers = 4, num_threads = 4, warp_mem_limit = 0):
         self.endpoint = endpoint
         self.collection = collection
         #self.geometry = geometry
@@ -146,23 +655,35 @@ class getImageSentinel2:
         self.fname = fname
         self.mgrs_tile = mgrs_tile
         self.scale = scale
+        self.cache = cache
+        self.index = index
+        self.max_workers = max_workers
+        self.num_threads = num_threads
+        self.warp_mem_limit = warp_mem_limit
         #self.output_format = output_format
 
     def get_data(self):
 
+        index = resolve_index(self.index, self.endpoint)
+        if index is not None and not index.has_data(self.collection, self.time_t, self.min_lat, self.max_lat, self.min_long, self.max_long):
+            raise ValueError('No data was available for {} at {} in the requested area'.format(self.collection, self.time_t))
+
+        if self.mgrs_tile == 'auto' or isinstance(self.mgrs_tile, (list, tuple)):
+            return self.get_mosaic()
+
         if self.masking == True:
             df = gpd.read_file(self.geometry)
             geom = df['geometry'][0]
             if self.mgrs_tile != 'None':
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(self.endpoint,self.time_t,self.collection, geom.bounds[1]-1, geom.bounds[3]+1, geom.bounds[0]-1, geom.bounds[2]+1, self.token, self.scale,self.mgrs_tile)
+                url = self.tile_url(geom.bounds[1]-1, geom.bounds[3]+1, geom.bounds[0]-1, geom.bounds[2]+1, self.mgrs_tile)
             else:
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}".format(self.endpoint,self.time_t,self.collection, geom.bounds[1], geom.bounds[3], geom.bounds[0], geom.bounds[2], self.token, self.scale)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}".format(wcs_url(self.endpoint),self.time_t,self.collection, geom.bounds[1], geom.bounds[3], geom.bounds[0], geom.bounds[2], self.token, self.scale)
 
         else:
             if self.mgrs_tile != 'None':
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale, self.mgrs_tile)
+                url = self.tile_url(self.min_lat, self.max_lat, self.min_long, self.max_long, self.mgrs_tile)
             else:
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}".format(wcs_url(self.endpoint),self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale)
 
         # if self.mgrs_tile != 'None':
         #     url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&mgrs_tile={}&filter=false".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.mgrs_tile)
@@ -170,51 +691,67 @@ class getImageSentinel2:
         #     url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&CoverageId={}&token={}&mgrs_tile={}&filter=false".format(self.endpoint,self.time_t,self.collection, self.token, self.mgrs_tile)
 
         #print(url)
-        result = requests.get(url)
-        with open(self.fname, 'wb') as f:
-            f.write(result.content)
-            f.close()
-
+        content = wcs_request(url, self.cache, component='getImageSentinel2')
 
         #if image is sentinel2 tiled transform to EPSG:4326
         dst_crs = 'EPSG:4326'
 
-        with rasterio.open(self.fname) as src:
-            transform, width, height = calculate_default_transform(
-                src.crs, dst_crs, src.width, src.height, *src.bounds)
-            kwargs = src.meta.copy()
-            kwargs.update({
-                'crs': dst_crs,
-                'transform': transform,
-                'width': width,
-                'height': height,
-                'dtype': 'float32',
-                'bbox': src.bounds
-            })
-            new_fname = '4326_{}'.format(self.fname)
-            with rasterio.open(new_fname, 'w', **kwargs) as dst:
-                for i in range(1, src.count + 1):
-                    reproject(
-                        source=rasterio.band(src, i),
-                        destination=rasterio.band(dst, i),
-                        src_transform=src.transform,
-                        src_crs=src.crs,
-                        dst_transform=transform,
-                        dst_crs=dst_crs,
-                        resampling=Resampling.nearest)
+        ###the response is decoded and warped in memory, the file is only written when fname is given
+        with rasterio.io.MemoryFile(content) as memfile:
+            with memfile.open() as src:
+                ###the output grid gets its own stage, so that every call reports a single 'warp' event
+                with timed_stage('warp_grid', component='getImageSentinel2'):
+                    transform, width, height = rasterio.warp.calculate_default_transform(
+                        src.crs, dst_crs, src.width, src.height, *src.bounds)
+                kwargs = src.meta.copy()
+                kwargs.update({
+                    'crs': dst_crs,
+                    'transform': transform,
+                    'width': width,
+                    'height': height,
+                    'dtype': 'float32'
+                })
+                with rasterio.io.MemoryFile() as dst_memfile:
+                    with dst_memfile.open(**kwargs) as dst:
+                        with timed_stage('warp', component='getImageSentinel2'):
+                            for i in range(1, src.count + 1):
+                                rasterio.warp.reproject(
+                                    source=rasterio.band(src, i),
+                                    destination=rasterio.band(dst, i),
+                                    src_transform=src.transform,
+                                    src_crs=src.crs,
+                                    dst_transform=transform,
+                                    dst_crs=dst_crs,
+                                    resampling=rasterio.warp.Resampling.nearest,
+                                    num_threads=self.num_threads,
+                                    warp_mem_limit=self.warp_mem_limit)
+
+                    with dst_memfile.open() as src:
+                        with timed_stage('decode', component='getImageSentinel2'):
+                            out_image = src.read(1)
+                            out_image[out_image == src.nodata] = 'nan'
+                            out_meta = src.meta.copy()
+                            #out_meta.update({"offset": src.offsets[0],
+                            #                "scale": src.scales[0]})
+
+                        if self.masking == True:
+                            out_image, out_meta = self.mask_image(src)
+
+        if self.fname != 'None':
+            with timed_stage('write', component='getImageSentinel2'):
+                with rasterio.open(self.fname, 'w', **out_meta) as dst:
+                    dst.write_band(1, out_image)
 
-        src = rasterio.open(new_fname)
-        out_image = src.read(1)
-        out_image = out_image.astype(np.float32)
-        out_image[out_image == src.nodata] = 'nan'
-        out_meta = src.meta.copy()
-        #out_meta.update({"offset": src.offsets[0],
-        #                "scale": src.scales[0]})
+        return out_image, out_meta
 
-        if self.masking == True:
+    def tile_url(self, min_lat, max_lat, min_long, max_long, mgrs_tile):
+        return "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(wcs_url(self.endpoint),self.time_t,self.collection, min_lat, max_lat, min_long, max_long, self.token, self.scale, mgrs_tile)
+
+    def mask_image(self, src):
+        with timed_stage('mask', component='getImageSentinel2'):
             with fiona.open(self.geometry, "r") as shapefile:
                 features = [feature["geometry"] for feature in shapefile]
-            out_image, out_transform = mask(src, features, crop=True)
+            out_image, out_transform = rasterio.mask.mask(src, features, crop=True)
             out_image = out_image.astype(np.float32)
             out_image[out_image == src.nodata] = 'nan'
             out_image = out_image[0,:,:]
@@ -224,14 +761,101 @@ class getImageSentinel2:
                             "width": out_image.shape[1],
                             "transform": out_transform,
                             "bbox": src.bounds})
+        return out_image, out_meta
 
-        with rasterio.open(self.fname, 'w', **out_meta) as dst:
-            dst.write_band(1, out_image)
+    def get_mosaic(self):
+
+        if self.masking == True:
+            df = gpd.read_file(self.geometry)
+            min_long, min_lat, max_long, max_lat = df['geometry'][0].bounds
+            bounds = (min_lat-1, max_lat+1, min_long-1, max_long+1)
+        else:
+            min_lat, max_lat, min_long, max_long = self.min_lat, self.max_lat, self.min_long, self.max_long
+            bounds = (min_lat, max_lat, min_long, max_long)
+
+        if self.mgrs_tile == 'auto':
+            ###a 10 x 10 deg box already touches about 150 tiles, larger boxes (e.g. the global default) are rejected
+            if max_lat - min_lat > MGRS_AUTO_MAX_EXTENT or max_long - min_long > MGRS_AUTO_MAX_EXTENT:
+                raise ValueError("mgrs_tile='auto' needs a bounding box of at most {} deg, give a smaller box or a list of tiles".format(MGRS_AUTO_MAX_EXTENT))
+            tiles = mgrs_tiles_for_bbox(min_lat, max_lat, min_long, max_long)
+        else:
+            tiles = list(self.mgrs_tile)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            contents = list(executor.map(
+                lambda tile: wcs_request(self.tile_url(*bounds, tile), self.cache, component='getImageSentinel2'), tiles))
+
+        ###tiles without data for the requested date are answered with an ExceptionReport and skipped
+        contents = [content for content in contents if b'ExceptionReport' not in content[:1024]]
+        if not contents:
+            raise ValueError('no data found for the MGRS tiles {}'.format(', '.join(tiles)))
+
+        dst_crs = 'EPSG:4326'
+        memfiles = [rasterio.io.MemoryFile(content) for content in contents]
+        try:
+            sources = [memfile.open() for memfile in memfiles]
+
+            ###common EPSG:4326 grid covering all tiles at the finest resolution of the warped tiles
+            with timed_stage('warp_grid', component='getImageSentinel2'):
+                res_x, res_y = np.inf, np.inf
+                left, bottom, right, top = np.inf, np.inf, -np.inf, -np.inf
+                for src in sources:
+                    transform, width, height = rasterio.warp.calculate_default_transform(
+                        src.crs, dst_crs, src.width, src.height, *src.bounds)
+                    res_x, res_y = min(res_x, transform.a), min(res_y, -transform.e)
+                    left, top = min(left, transform.c), max(top, transform.f)
+                    right, bottom = max(right, transform.c + width * transform.a), min(bottom, transform.f + height * transform.e)
+                width = int(np.ceil((right - left) / res_x))
+                height = int(np.ceil((top - bottom) / res_y))
+                transform = rasterio.transform.from_origin(left, top, res_x, res_y)
+
+            with timed_stage('warp', component='getImageSentinel2'):
+                ###tiles are warped one after the other into the mosaic, each warp uses num_threads GDAL threads.
+                ###Pixels already filled by a previous tile are only overwritten by valid pixels of the next one.
+                out_image = np.full((height, width), np.nan, dtype=np.float32)
+                for src in sources:
+                    rasterio.warp.reproject(
+                        source=rasterio.band(src, 1),
+                        destination=out_image,
+                        src_transform=src.transform,
+                        src_crs=src.crs,
+                        src_nodata=src.nodata,
+                        dst_transform=transform,
+                        dst_crs=dst_crs,
+                        dst_nodata=np.nan,
+                        init_dest_nodata=False,
+                        resampling=rasterio.warp.Resampling.nearest,
+                        num_threads=self.num_threads,
+                        warp_mem_limit=self.warp_mem_limit)
+
+            out_meta = {'driver': 'GTiff',
+                        'dtype': 'float32',
+                        'nodata': np.nan,
+                        'width': width,
+                        'height': height,
+                        'count': 1,
+                        'crs': rasterio.crs.CRS.from_string(dst_crs),
+                        'transform': transform}
+        finally:
+            for memfile in memfiles:
+                memfile.close()
+
+        if self.masking == True:
+            with rasterio.io.MemoryFile() as dst_memfile:
+                with dst_memfile.open(**out_meta) as dst:
+                    dst.write_band(1, out_image)
+                with dst_memfile.open() as src:
+                    out_image, out_meta = self.mask_image(src)
+
+        if self.fname != 'None':
+            with timed_stage('write', component='getImageSentinel2'):
+                with rasterio.open(self.fname, 'w', **out_meta) as dst:
+                    dst.write_band(1, out_image)
 
         return out_image, out_meta
 
 class getImageSentinel5p:
-    def __init__(self, endpoint, collection, time_t, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180, token = 'None', geometry = 'None', masking = False, fname = 'image.tif', mgrs_tile = 'None', scale = 1):
+    def __init__(self, endpoint, collection, time_t, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180, token = 'None', geometry = 'None', masking = False, fname = 'None', mgrs_tile = 'None', scale = 1, cache = None, index = None):
         self.endpoint = endpoint
         self.collection = collection
         #self.geometry = geometry
@@ -246,23 +870,29 @@ class getImageSentinel5p:
         self.fname = fname
         self.mgrs_tile = mgrs_tile
         self.scale = scale
+        self.cache = cache
+        self.index = index
         #self.output_format = output_format
 
     def get_data(self):
 
+        index = resolve_index(self.index, self.endpoint)
+        if index is not None and not index.has_data(self.collection, self.time_t, self.min_lat, self.max_lat, self.min_long, self.max_long):
+            raise ValueError('No data was available for {} at {} in the requested area'.format(self.collection, self.time_t))
+
         if self.masking == True:
             df = gpd.read_file(self.geometry)
             geom = df['geometry'][0]
             if self.mgrs_tile != 'None':
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(self.endpoint,self.time_t,self.collection, geom.bounds[1]-1, geom.bounds[3]+1, geom.bounds[0]-1, geom.bounds[2]+1, self.token, self.scale,self.mgrs_tile)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(wcs_url(self.endpoint),self.time_t,self.collection, geom.bounds[1]-1, geom.bounds[3]+1, geom.bounds[0]-1, geom.bounds[2]+1, self.token, self.scale,self.mgrs_tile)
             else:
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&nodata=9969209968386869046778552952102584320".format(self.endpoint,self.time_t,self.collection, geom.bounds[1], geom.bounds[3], geom.bounds[0], geom.bounds[2], self.token, self.scale)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&nodata=9969209968386869046778552952102584320".format(wcs_url(self.endpoint),self.time_t,self.collection, geom.bounds[1], geom.bounds[3], geom.bounds[0], geom.bounds[2], self.token, self.scale)
 
         else:
             if self.mgrs_tile != 'None':
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale, self.mgrs_tile)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&mgrs_tile={}".format(wcs_url(self.endpoint),self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale, self.mgrs_tile)
             else:
-                url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&nodata=9969209968386869046778552952102584320".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale)
+                url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&filter=false&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&scale={}&nodata=9969209968386869046778552952102584320".format(wcs_url(self.endpoint),self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.scale)
 
         # if self.mgrs_tile != 'None':
         #     url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}&mgrs_tile={}&filter=false".format(self.endpoint,self.time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token, self.mgrs_tile)
@@ -270,47 +900,47 @@ class getImageSentinel5p:
         #     url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&CoverageId={}&token={}&mgrs_tile={}&filter=false".format(self.endpoint,self.time_t,self.collection, self.token, self.mgrs_tile)
 
         #print(url)
-        result = requests.get(url)
-        with open(self.fname, 'wb') as f:
-            f.write(result.content)
-            f.close()
-
-
-        #if image is sentinel2 tiled transform to EPSG:4326
-
-
-        src = rasterio.open(self.fname)
-        out_image = src.read(1)
-        out_image = out_image.astype(np.float32)
-        out_image[out_image == src.nodata] = 'nan'
-        out_image[out_image > 1000] = 0
-        out_image[out_image < 0] = 0
-        out_image[out_image == 0] = 'nan'
-        out_meta = src.meta.copy()
-        out_meta.update({"bbox": src.bounds})
-
-
-        if self.masking == True:
-            with fiona.open(self.geometry, "r") as shapefile:
-                features = [feature["geometry"] for feature in shapefile]
-            out_image, out_transform = mask(src, features, crop=True)
-            out_image = out_image.astype(np.float32)
-            out_image[out_image == src.nodata] = 'nan'
-            out_image[out_image > 1000] = 0
-            out_image[out_image < 0] = 0
-            out_image[out_image == 0] = 'nan'
-            out_image = out_image[0,:,:]
-            out_meta = src.meta.copy()
-            out_meta.update({"driver": "GTiff",
-                            "height": out_image.shape[0],
-                            "width": out_image.shape[1],
-                            "transform": out_transform})
+        content = wcs_request(url, self.cache, component='getImageSentinel5p')
+        if self.fname != 'None':
+            with timed_stage('write', component='getImageSentinel5p'):
+                with open(self.fname, 'wb') as f:
+                    f.write(content)
+
+        ###the response is decoded in memory, the file is only written when fname is given
+        with rasterio.io.MemoryFile(content) as memfile:
+            with memfile.open() as src:
+                with timed_stage('decode', component='getImageSentinel5p'):
+                    out_image = src.read(1, out_dtype=np.float32)
+                    out_image[out_image == src.nodata] = 'nan'
+                    out_image[out_image > 1000] = 0
+                    out_image[out_image < 0] = 0
+                    out_image[out_image == 0] = 'nan'
+                    out_meta = src.meta.copy()
+                    out_meta.update({"bbox": src.bounds})
+
+
+                if self.masking == True:
+                    with timed_stage('mask', component='getImageSentinel5p'):
+                        with fiona.open(self.geometry, "r") as shapefile:
+                            features = [feature["geometry"] for feature in shapefile]
+                        out_image, out_transform = rasterio.mask.mask(src, features, crop=True)
+                        out_image = out_image.astype(np.float32)
+                        out_image[out_image == src.nodata] = 'nan'
+                        out_image[out_image > 1000] = 0
+                        out_image[out_image < 0] = 0
+                        out_image[out_image == 0] = 'nan'
+                        out_image = out_image[0,:,:]
+                        out_meta = src.meta.copy()
+                        out_meta.update({"driver": "GTiff",
+                                        "height": out_image.shape[0],
+                                        "width": out_image.shape[1],
+                                        "transform": out_transform})
 
         return out_image, out_meta
 
 
 class getTimeSeries:
-    def __init__(self, endpoint, collection, time_t, lat, long, token = 'None', mgrs_tile = 'None'):
+    def __init__(self, endpoint, collection, time_t, lat, long, token = 'None', mgrs_tile = 'None', cache = None, index = None):
         self.endpoint = endpoint
         self.collection = collection
         self.time_t = time_t
@@ -318,55 +948,127 @@ class getTimeSeries:
         self.long = long
         self.token = token
         self.mgrs_tile = mgrs_tile
+        self.cache = cache
+        self.index = index
 
     def get_data(self):
-        url = 'https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=application/xml&CoverageId={}&subset=Lat({})&subset=Long({})&filter=false&token={}&mgrs_tile={}'.format(self.endpoint, self.time_t, self.collection, self.lat, self.long, self.token, self.mgrs_tile)
-        result = requests.get(url)
-        xml_data = result.text
+        index = resolve_index(self.index, self.endpoint)
+        if index is not None and not index.has_data(self.collection, self.time_t, self.lat, self.lat, self.long, self.long):
+            print('No data was available for ', self.time_t)
+            return [],[]
+
+        url = '{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=application/xml&CoverageId={}&subset=Lat({})&subset=Long({})&filter=false&token={}&mgrs_tile={}'.format(wcs_url(self.endpoint), self.time_t, self.collection, self.lat, self.long, self.token, self.mgrs_tile)
+        content = wcs_request(url, self.cache, component='getTimeSeries')
+        xml_data = content.decode('utf-8')
 
         try:
             tree = ET.fromstring(xml_data)
         except:
-            print('No data was available for ', time_t)
+            print('No data was available for ', self.time_t)
             #print(url)
-            print(result,'\n\n')
+            print(xml_data[:200],'\n\n')
             return [],[]
 
-        for t in tree.iter('{http://www.opengis.net/gml/3.2}lowerCorner'):
-            # split string into list of coordinates
-            time_delta = t.text.split()
-            time_delta = time_delta[2]
+        try:
+            with timed_stage('parse', component='getTimeSeries'):
+                data, dates = parse_time_series(tree)
+        except noTimeSeriesError:
+            print('No data was available for ', self.time_t)
+            print(xml_data[:200],'\n\n')
+            return [],[]
 
-        for t in tree.iter('{http://www.opengis.net/gml/3.2}tupleList'):
-            # split string into list temps
-            data = t.text
-            #print(dates)
-        #split
-        data = data.split()
-        #split again
-        data = data[0].split(',')
+        times = []
+        for i in range(0,len(dates)):
+            times.append(datetime.fromtimestamp(int(dates[i])).strftime('%Y-%m-%dT%H:%M'))
 
-        data = np.array(data).astype(float)
+        return data, times
 
 
-        for t in tree.iter('{http://www.opengis.net/gml/3.3/rgrid}coefficients'):
-            # extract dates
-            dates = t.text
+class getTimeSeriesBatch:
+    def __init__(self, endpoint, collection, time_t, lats, longs, token = 'None', mgrs_tile = 'None', max_workers = 8, cache = None, index = None):
+        self.endpoint = endpoint
+        self.collection = collection
+        self.time_t = time_t
+        self.lats = lats
+        self.longs = longs
+        self.token = token
+        self.mgrs_tile = mgrs_tile
+        self.max_workers = max_workers
+        self.cache = cache
+        self.index = index
 
-        #print(data_mean)
-        times = []
-        dates = dates.split()
+    def fetch_point(self, session, lat, long, index = None):
+        if index is not None and not index.has_data(self.collection, self.time_t, lat, lat, long, long):
+            print('No data was available for ', lat, long)
+            return np.array([], dtype=float), np.array([], dtype=np.int64)
 
-        for i in range(0,len(dates)):
-            dates[i] = int(dates[i]) + int(time_delta)
+        url = '{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=application/xml&CoverageId={}&subset=Lat({})&subset=Long({})&filter=false&token={}&mgrs_tile={}'.format(wcs_url(self.endpoint), self.time_t, self.collection, lat, long, self.token, self.mgrs_tile)
+        content = wcs_request(url, self.cache, session, component='getTimeSeriesBatch')
 
-        for i in range(0,len(dates)):
-            times.append(datetime.fromtimestamp(int(dates[i])).strftime('%Y-%m-%dT%H:%M'))
+        ###a station without data gives an empty series (a row of nan) instead of aborting the batch
+        try:
+            tree = ET.fromstring(content.decode('utf-8'))
+            return parse_time_series(tree)
+        except (ET.ParseError, noTimeSeriesError):
+            print('No data was available for ', lat, long)
+            return np.array([], dtype=float), np.array([], dtype=np.int64)
 
-        return data, times
+    ###returns a xarray Dataset with one series per station on the union of all timestamps, missing values are nan
+    def get_data(self):
+        lats = np.asarray(self.lats, dtype=float)
+        longs = np.asarray(self.longs, dtype=float)
+
+        session = get_session()
+        index = resolve_index(self.index, self.endpoint)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            series = list(pool.map(lambda point: self.fetch_point(session, *point, index), zip(lats, longs)))
+
+        times = np.unique(np.concatenate([dates for _, dates in series] + [np.array([], dtype=np.int64)]))
+        values = np.full((len(series), len(times)), np.nan)
+        for i, (data, dates) in enumerate(series):
+            values[i, np.searchsorted(times, dates)] = data
+
+        return xr.Dataset({self.collection: (('station', 'time'), values)},
+                          coords={'station': np.arange(len(series)),
+                                  'latitude': ('station', lats),
+                                  'longitude': ('station', longs),
+                                  'time': times.astype('datetime64[s]')})
+
+
+###raised by parse_time_series for valid XML without a time series, e.g. an ExceptionReport
+class noTimeSeriesError(ValueError):
+    pass
+
+def parse_time_series(tree):
+    time_delta, data, dates = None, None, None
+    for t in tree.iter('{http://www.opengis.net/gml/3.2}lowerCorner'):
+        # split string into list of coordinates
+        time_delta = t.text.split()
+        time_delta = time_delta[2]
+
+    for t in tree.iter('{http://www.opengis.net/gml/3.2}tupleList'):
+        # split string into list temps
+        data = t.text
+    for t in tree.iter('{http://www.opengis.net/gml/3.3/rgrid}coefficients'):
+        # extract dates
+        dates = t.text
+    if time_delta is None or data is None or dates is None:
+        raise noTimeSeriesError('the response contains no time series')
+
+    #split
+    data = data.split()
+    #split again
+    data = data[0].split(',')
+
+    data = np.array(data).astype(float)
+
+    ###timestamps are decoded in one go as seconds since 1970
+    dates = np.array(dates.split(), dtype=np.int64) + int(time_delta)
+
+    return data, dates
 
 class getAnimation:
-    def __init__(self, endpoint, collection, start_date, end_date, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180, token = 'None', geometry = 'None', masking = False, frame_duration = 0.1, legend = False):
+    def __init__(self, endpoint, collection, start_date, end_date, min_lat = -90, max_lat = 90, min_long = -180, max_long = 180, token = 'None', geometry = 'None', masking = False, frame_duration = 0.1, legend = False, fetch_workers = 1, render_workers = 1, cache = None, cube = None, index = None):
         self.endpoint = endpoint
         self.collection = collection
         #self.geometry = geometry
@@ -381,9 +1083,26 @@ class getAnimation:
         self.masking = masking
         self.frame_duration = frame_duration
         self.legend = legend
+        self.fetch_workers = fetch_workers
+        self.render_workers = render_workers
+        self.cache = cache
+        self.index = index
+        self.cube = cube
 
         #self.output_format = output_format
 
+    def fetch_frame(self, session, time_t):
+        url = "{}?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}".format(wcs_url(self.endpoint),time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token)
+        #print(url)
+        return wcs_request(url, self.cache, session, component='getAnimation')
+
+    def render_pending(self, render_pool, fetched):
+        ###runs in the main thread: the raster is added to the cube and its rendering is submitted
+        time_t, future = fetched
+        content = future.result()
+        if self.cube is not None:
+            self.cube.append_geotiff(content, time_t)
+        return render_pool.submit(render_frame, content, self.collection, time_t, self.geometry, self.masking, self.legend)
 
     def get_data(self):
 
@@ -391,63 +1110,235 @@ class getAnimation:
             for n in range(int ((end_date - start_date).days)):
                 yield start_date + timedelta(n)
 
-        filenames = []
-        for single_date in daterange(self.start_date, self.end_date):
-            time_t = '{}T00:00:00,{}T23:59:59'.format(single_date,single_date)
-            url = "https://{}/wcs?service=WCS&Request=GetCoverage&version=2.0.0&subset=unix({})&format=image/tiff&CoverageId={}&subset=Lat({},{})&subset=Long({},{})&token={}".format(self.endpoint,time_t,self.collection, self.min_lat, self.max_lat, self.min_long, self.max_long, self.token)
-            #print(url)
-            result = requests.get(url)
-            if not os.path.exists('temp'):
-                os.makedirs('temp')
-            fname = 'temp/{}.tif'.format( time_t)
+        time_list = ['{}T00:00:00,{}T23:59:59'.format(single_date,single_date) for single_date in daterange(self.start_date, self.end_date)]
+
+        ###days without coverage are skipped before going to the network
+        index = resolve_index(self.index, self.endpoint)
+        if index is not None:
+            available = []
+            for time_t in time_list:
+                if index.has_data(self.collection, time_t, self.min_lat, self.max_lat, self.min_long, self.max_long):
+                    available.append(time_t)
+                else:
+                    print('No data was available for ', time_t.split(',')[0])
+            time_list = available
+        if not time_list:
+            raise ValueError('No data was available for {} between {} and {}'.format(self.collection, self.start_date, self.end_date))
 
+        if not os.path.exists('gifs'):
+            os.makedirs('gifs')
 
-            with open(fname, 'wb') as f:
-                f.write(result.content)
-                f.close()
+        gif_fname = 'gifs/{}_{}.gif'.format(self.collection, time_list[-1].split(',')[0])
+
+        session = get_session()
+        with imageio.get_writer(gif_fname, mode='I', duration=self.frame_duration) as writer:
+            if self.fetch_workers == 1 and self.render_workers == 1:
+                for time_t in time_list:
+                    content = self.fetch_frame(session, time_t)
+                    ###the rasters are kept in the cube store instead of being thrown away after rendering
+                    if self.cube is not None:
+                        self.cube.append_geotiff(content, time_t)
+                    with timed_stage('render', component='getAnimation'):
+                        frame = render_frame(content, self.collection, time_t, self.geometry, self.masking, self.legend)
+                    writer.append_data(frame)
+            else:
+                ### frames are fetched by a thread pool and rendered by a process pool, at most 2 * fetch_workers
+                ### fetched and 2 * render_workers rendered frames are held in memory. Renderings are only submitted
+                ### from the main thread, in order.
+                fetched = deque()
+                rendered = deque()
+                with ProcessPoolExecutor(max_workers=self.render_workers) as render_pool:
+                    ### with fork all workers are started on the first submit, this happens before the fetch threads
+                    ### exist, so that no worker inherits a lock held by another thread (GDAL, urllib3)
+                    render_pool.submit(int).result()
+                    with ThreadPoolExecutor(max_workers=self.fetch_workers) as fetch_pool:
+                        for time_t in time_list:
+                            fetched.append((time_t, fetch_pool.submit(self.fetch_frame, session, time_t)))
+                            if len(fetched) >= 2 * self.fetch_workers:
+                                rendered.append(self.render_pending(render_pool, fetched.popleft()))
+                            if len(rendered) >= 2 * self.render_workers:
+                                writer.append_data(rendered.popleft().result())
+                        while fetched:
+                            rendered.append(self.render_pending(render_pool, fetched.popleft()))
+                            if len(rendered) >= 2 * self.render_workers:
+                                writer.append_data(rendered.popleft().result())
+                    while rendered:
+                        writer.append_data(rendered.popleft().result())
 
-            src = rasterio.open(fname)
+        return gif_fname
+
+
+def render_frame(content, collection, time_t, geometry = 'None', masking = False, legend = False):
+    with rasterio.io.MemoryFile(content) as memfile:
+        with memfile.open() as src:
             out_image = src.read(1)
-            out_meta = src.meta.copy()
             out_image = out_image.astype(float)
             out_image[out_image == src.nodata] = 'nan'
 
-            if self.masking == True:
-                with fiona.open(self.geometry, "r") as shapefile:
+            if masking == True:
+                with fiona.open(geometry, "r") as shapefile:
                     features = [feature["geometry"] for feature in shapefile]
-                out_image, out_transform = mask(src, features, crop=True)
+                out_image, out_transform = rasterio.mask.mask(src, features, crop=True)
                 out_image = out_image.astype(float)
                 out_image[out_image == src.nodata] = 'nan'
                 out_image = out_image[0,:,:]
-                out_meta = src.meta.copy()
-                out_meta.update({"driver": "GTiff",
-                                "height": out_image.shape[0],
-                                "width": out_image.shape[1],
-                                "transform": out_transform})
-
-            plt.subplots(figsize=(13,13))
-            plt.imshow((out_image[:,:]))
-            plt.title('{} | {}'.format(self.collection,time_t.split(',')[0]), size=20)
-            plt.axis('off')
-            if self.legend == True:
-                plt.colorbar()
-
-            plt.savefig('{}'.format(fname[:-4]))
-            plt.close()
-            filenames.append('{}.png'.format(fname[:-4]))
-
-        if not os.path.exists('gifs'):
-            os.makedirs('gifs')
 
-        gif_fname = 'gifs/{}_{}.gif'.format(self.collection, time_t.split(',')[0])
-
-        images = [imageio.imread(f) for f in filenames]
-        imageio.mimsave(gif_fname, images, duration=self.frame_duration)
-        # with imageio.get_writer(gif_fname, mode='I', duration = 5) as writer:
-        #     for filename in filenames:
-        #         image = imageio.imread(filename)
-        #         writer.append_data(image)
-
-        shutil.rmtree('temp')
-
-        return gif_fname
+    ### draw on a standalone Agg canvas so that frames can be rendered in worker processes without pyplot state
+    fig = matplotlib.figure.Figure(figsize=(13,13))
+    canvas = backend_agg.FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    img = ax.imshow((out_image[:,:]))
+    ax.set_title('{} | {}'.format(collection,time_t.split(',')[0]), size=20)
+    ax.axis('off')
+    if legend == True:
+        fig.colorbar(img, ax=ax)
+
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba())[:,:,:3].copy()
+
+
+###time indexed data cubes: fetched images are appended to a chunked Zarr store or to a directory of
+###Cloud-Optimized GeoTIFFs, e.g. cube.append(*getImage(endpoint, collection, time_t).get_data(), time_t)
+def cube_time(time_t):
+    ###accepts adampy time strings ('start,end', the start is used), dates, datetimes and numpy datetime64
+    if isinstance(time_t, str):
+        time_t = time_t.split(',')[0]
+    return np.datetime64(time_t).astype('datetime64[s]')
+
+def image_to_dataarray(out_image, out_meta, name = 'data'):
+    ###pixel centre coordinates of an (out_image, out_meta) pair as returned by the getters
+    transform = out_meta['transform']
+    height, width = out_image.shape
+    return xr.DataArray(out_image.astype(np.float32), dims=('latitude', 'longitude'), name=name,
+                        coords={'latitude': transform.f + (np.arange(height) + 0.5) * transform.e,
+                                'longitude': transform.c + (np.arange(width) + 0.5) * transform.a})
+
+def read_cube_window(path, window):
+    with rasterio.open(path) as src:
+        return src.read(1, window=window, out_dtype=np.float32)
+
+class cubeStore:
+    def __init__(self, path, variable = 'data', store_format = 'zarr', chunks = 512):
+        if store_format not in ('zarr', 'cog'):
+            raise ValueError("store_format must be 'zarr' or 'cog'")
+        self.path = path
+        self.variable = variable
+        self.store_format = store_format
+        self.chunks = chunks
+        self.lock = threading.Lock()
+
+    def cog_fname(self, time):
+        return os.path.join(self.path, '{}_{}.tif'.format(self.variable, str(time).replace('-', '').replace(':', '')))
+
+    def cog_files(self):
+        if not os.path.isdir(self.path):
+            return []
+        pattern = re.compile(r'{}_(\d{{8}}T\d{{6}})\.tif$'.format(re.escape(self.variable)))
+        files = []
+        for fname in os.listdir(self.path):
+            match = pattern.match(fname)
+            if match:
+                files.append((np.datetime64(datetime.strptime(match.group(1), '%Y%m%dT%H%M%S'), 's'), os.path.join(self.path, fname)))
+        return sorted(files)
+
+    def times(self):
+        if self.store_format == 'cog':
+            return [time for time, fname in self.cog_files()]
+        if not os.path.exists(self.path):
+            return []
+        with xr.open_zarr(self.path) as ds:
+            return list(ds['time'].values.astype('datetime64[s]'))
+
+    def append(self, out_image, out_meta, time_t):
+        return self.append_dataarray(image_to_dataarray(out_image, out_meta, self.variable), time_t)
+
+    def append_geotiff(self, content, time_t):
+        ###appends the GeoTIFF bytes of a WCS response
+        with rasterio.io.MemoryFile(content) as memfile:
+            with memfile.open() as src:
+                out_image = src.read(1, out_dtype=np.float32)
+                out_image[out_image == src.nodata] = 'nan'
+                out_meta = src.meta.copy()
+        return self.append(out_image, out_meta, time_t)
+
+    def append_dataarray(self, data_array, time_t):
+        ###data_array needs latitude and longitude dimensions on a regular grid, timestamps already
+        ###in the store are skipped. Returns True if the timestamp was added.
+        time = cube_time(time_t)
+        data_array = data_array.astype(np.float32).transpose('latitude', 'longitude').rename(self.variable)
+        with self.lock, timed_stage('cube_append', component='cubeStore'):
+            if time in self.times():
+                return False
+            if self.store_format == 'zarr':
+                self.append_zarr(data_array, time)
+            else:
+                self.append_cog(data_array, time)
+        return True
+
+    def append_zarr(self, data_array, time):
+        ds = data_array.expand_dims(time=[time]).to_dataset()
+        if not os.path.exists(self.path):
+            chunks = (1, min(self.chunks, ds.sizes['latitude']), min(self.chunks, ds.sizes['longitude']))
+            ds.to_zarr(self.path, mode='w-', encoding={self.variable: {'chunks': chunks}})
+            return
+        with xr.open_zarr(self.path) as existing:
+            if existing.sizes['latitude'] != ds.sizes['latitude'] or existing.sizes['longitude'] != ds.sizes['longitude'] \
+                    or not np.allclose(existing['latitude'].values, ds['latitude'].values) \
+                    or not np.allclose(existing['longitude'].values, ds['longitude'].values):
+                raise ValueError('the grid of the new data does not match the grid of {}'.format(self.path))
+        ds.to_zarr(self.path, append_dim='time')
+
+    def append_cog(self, data_array, time):
+        if data_array['latitude'].values[0] < data_array['latitude'].values[-1]:
+            data_array = data_array.isel(latitude=slice(None, None, -1))
+        latitude = data_array['latitude'].values
+        longitude = data_array['longitude'].values
+        res_y = abs(latitude[1] - latitude[0]) if len(latitude) > 1 else 1
+        res_x = abs(longitude[1] - longitude[0]) if len(longitude) > 1 else 1
+        transform = rasterio.transform.from_origin(longitude[0] - res_x / 2, latitude[0] + res_y / 2, res_x, res_y)
+
+        files = self.cog_files()
+        if files:
+            with rasterio.open(files[0][1]) as src:
+                if src.width != len(longitude) or src.height != len(latitude) \
+                        or not src.transform.almost_equals(transform):
+                    raise ValueError('the grid of the new data does not match the grid of {}'.format(self.path))
+
+        os.makedirs(self.path, exist_ok=True)
+        fname = self.cog_fname(time)
+        ###written under a temporary name so that readers never see a partial file
+        with rasterio.open(fname + '.part', 'w', driver='COG', width=len(longitude), height=len(latitude), count=1,
+                           dtype='float32', crs='EPSG:4326', transform=transform, nodata=np.nan,
+                           BLOCKSIZE=self.chunks, COMPRESS='DEFLATE', PREDICTOR=3) as dst:
+            dst.write(data_array.values, 1)
+        os.replace(fname + '.part', fname)
+
+    def open(self):
+        ###returns a lazy, dask backed DataArray with (time, latitude, longitude) dimensions whose chunks
+        ###follow the chunks (Zarr) or blocks (COG) on disk
+        if self.store_format == 'zarr':
+            return xr.open_zarr(self.path)[self.variable].sortby('time')
+
+        files = self.cog_files()
+        if not files:
+            raise ValueError('{} contains no data'.format(self.path))
+        with rasterio.open(files[0][1]) as src:
+            height, width, transform = src.height, src.width, src.transform
+            block_height, block_width = src.block_shapes[0]
+
+        layers = []
+        for time, fname in files:
+            rows = []
+            for row in range(0, height, block_height):
+                blocks = []
+                for col in range(0, width, block_width):
+                    window = rasterio.windows.Window(col, row, min(block_width, width - col), min(block_height, height - row))
+                    blocks.append(da.from_delayed(dask.delayed(read_cube_window)(fname, window),
+                                                  shape=(window.height, window.width), dtype=np.float32))
+                rows.append(blocks)
+            layers.append(da.block(rows))
+
+        return xr.DataArray(da.stack(layers), dims=('time', 'latitude', 'longitude'), name=self.variable,
+                            coords={'time': np.array([time for time, fname in files], dtype='datetime64[ns]'),
+                                    'latitude': transform.f + (np.arange(height) + 0.5) * transform.e,
+                                    'longitude': transform.c + (np.arange(width) + 0.5) * transform.a})
@@ -0,0 +1,211 @@
+"""
+Local stand-ins for the WCS endpoint used by adampy and for the WEkEO HDA broker,
+so that the benchmarks can run without network access or credentials.
+
+Both servers run in a background thread and serve synthetic data whose size is
+set through the `config` dictionary of the server.
+"""
+import json
+import os
+import re
+import sys
+import threading
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds
+
+
+@lru_cache(maxsize=32)
+def make_geotiff(width, height, bounds, crs, nodata, seed=0):
+    """Returns the bytes of a single band float32 GeoTIFF filled with random values."""
+    rng = np.random.default_rng(seed)
+    data = rng.random((1, height, width), dtype=np.float32)
+    data[:, 0, :] = nodata
+    with MemoryFile() as memfile:
+        with memfile.open(driver='GTiff', width=width, height=height, count=1, dtype='float32', crs=crs,
+                          transform=from_bounds(*bounds, width, height), nodata=nodata) as dst:
+            dst.write(data)
+        return memfile.read()
+
+
+@lru_cache(maxsize=32)
+def make_time_series_xml(length, origin=1546300800):
+    """Returns a GML coverage of a point time series in the layout parsed by adampy.getTimeSeries."""
+    dates = ' '.join(str(86400 * i) for i in range(length))
+    values = ','.join('{:.4f}'.format(v) for v in np.random.default_rng(length).random(length))
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<gmlcov:GridCoverage xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:gmlcov="http://www.opengis.net/gmlcov/1.0" '
+            'xmlns:gmlrgrid="http://www.opengis.net/gml/3.3/rgrid">'
+            '<gml:boundedBy><gml:Envelope><gml:lowerCorner>0 0 {}</gml:lowerCorner></gml:Envelope></gml:boundedBy>'
+            '<gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis><gmlrgrid:coefficients>{}</gmlrgrid:coefficients>'
+            '</gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>'
+            '<gml:rangeSet><gml:DataBlock><gml:tupleList>{}</gml:tupleList></gml:DataBlock></gml:rangeSet>'
+            '</gmlcov:GridCoverage>').format(origin, dates, values).encode('utf-8')
+
+
+def make_capabilities_xml(collections):
+    summaries = ''.join('<wcs:CoverageSummary><wcs:CoverageId>{}</wcs:CoverageId></wcs:CoverageSummary>'.format(c)
+                        for c in collections)
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<wcs:Capabilities xmlns:wcs="http://www.opengis.net/wcs/2.0"><wcs:Contents>{}</wcs:Contents>'
+            '</wcs:Capabilities>').format(summaries).encode('utf-8')
+
+
+def make_coverage_description(collection, length, missing_days=(), origin=1546300800):
+    """Returns a DescribeCoverage answer with a global extent and one timestamp per day, except for missing_days."""
+    offsets = ' '.join(str(86400 * i) for i in range(length) if i not in missing_days)
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<wcs:CoverageDescriptions xmlns:wcs="http://www.opengis.net/wcs/2.0" xmlns:gml="http://www.opengis.net/gml/3.2" '
+            'xmlns:gmlrgrid="http://www.opengis.net/gml/3.3/rgrid"><wcs:CoverageDescription>'
+            '<gml:boundedBy><gml:Envelope axisLabels="Lat Long unix" srsDimension="3">'
+            '<gml:lowerCorner>-90 -180 {origin}</gml:lowerCorner><gml:upperCorner>90 180 {end}</gml:upperCorner>'
+            '</gml:Envelope></gml:boundedBy><wcs:CoverageId>{collection}</wcs:CoverageId>'
+            '<gmlrgrid:generalGridAxis><gmlrgrid:GeneralGridAxis><gmlrgrid:coefficients>{offsets}</gmlrgrid:coefficients>'
+            '<gmlrgrid:gridAxesSpanned>unix</gmlrgrid:gridAxesSpanned></gmlrgrid:GeneralGridAxis></gmlrgrid:generalGridAxis>'
+            '</wcs:CoverageDescription></wcs:CoverageDescriptions>').format(
+                origin=origin, end=origin + 86400 * length, collection=collection, offsets=offsets).encode('utf-8')
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler_class, config):
+        super().__init__(('127.0.0.1', 0), handler_class)
+        self.config = config
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def handle_error(self, request, client_address):
+        # download_data closes some connections after reading the headers only
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_port)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, content_type='application/octet-stream', status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reply_json(self, obj):
+        self.reply(json.dumps(obj).encode('utf-8'), 'application/json')
+
+
+class MockWCSHandler(MockHandler):
+    """
+    Serves GetCapabilities, DescribeCoverage and GetCoverage for image/tiff and application/xml.
+    Sentinel-2 requests (mgrs_tile given) are answered with a UTM raster, all others in EPSG:4326.
+    """
+
+    def do_GET(self):
+        config = self.server.config
+        params = parse_qsl(urlsplit(self.path).query)
+        query = dict((name.lower(), value) for name, value in params)
+        subsets = dict(re.match(r'(\w+)\((.*)\)', value).groups() for name, value in params if name.lower() == 'subset')
+
+        if query.get('request') == 'GetCapabilities':
+            return self.reply(make_capabilities_xml(tuple(config['collections'])), 'application/xml')
+
+        if query.get('request') == 'DescribeCoverage':
+            return self.reply(make_coverage_description(query.get('coverageid'), config['series_length'],
+                                                        tuple(config.get('missing_days', ()))), 'application/xml')
+
+        if query.get('format') == 'application/xml':
+            return self.reply(make_time_series_xml(config['series_length']), 'application/xml')
+
+        size = config['raster_size']
+        if query.get('mgrs_tile', 'None') != 'None':
+            return self.reply(make_geotiff(size, size, (300000, 5000000, 300000 + 10*size, 5000000 + 10*size),
+                                           'EPSG:32632', -9999.0), 'image/tiff')
+
+        min_lat, max_lat = [float(v) for v in subsets.get('Lat', '-90,90').split(',')]
+        min_long, max_long = [float(v) for v in subsets.get('Long', '-180,180').split(',')]
+        nodata = 9.969209968386869e36 if 'S5P' in query.get('coverageid', '') else -9999.0
+        return self.reply(make_geotiff(size, size, (min_long, min_lat, max_long, max_lat), 'EPSG:4326', nodata),
+                          'image/tiff')
+
+
+class MockBrokerHandler(MockHandler):
+    """
+    Serves the token, terms and conditions, datarequest, status, result list and result file
+    endpoints of the HDA broker. Result files support HTTP Range requests.
+    """
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        self.read_body()
+        if self.path.endswith('/token'):
+            return self.reply_json({'access_token': 'mock-token', 'expires_in': 3600})
+        if self.path.endswith('/datarequest'):
+            with self.server.lock:
+                job_id = 'job{}'.format(len(self.server.jobs))
+                self.server.jobs[job_id] = self.server.config['polls_until_complete']
+            return self.reply_json({'jobId': job_id})
+        self.reply(b'', status=404)
+
+    def do_PUT(self):
+        self.read_body()
+        self.reply_json({'accepted': True})
+
+    def do_GET(self):
+        config = self.server.config
+        path = urlsplit(self.path).path
+
+        if 'termsaccepted' in path:
+            return self.reply_json({'accepted': True})
+
+        if '/datarequest/status/' in path:
+            job_id = path.rsplit('/', 1)[1]
+            with self.server.lock:
+                self.server.jobs[job_id] -= 1
+                complete = self.server.jobs[job_id] <= 0
+            return self.reply_json({'complete': complete, 'resultNumber': config['n_files']})
+
+        if path.endswith('/result') and '/datarequest/jobs/' in path:
+            return self.reply_json({'content': [{'fileName': 'product_{}.nc'.format(i),
+                                                 'externalUri': 'product_{}.nc'.format(i),
+                                                 'fileSize': config['file_size']} for i in range(config['n_files'])]})
+
+        if '/datarequest/result/' in path:
+            name = dict(parse_qsl(urlsplit(self.path).query))['externalUri']
+            data = make_file(config['file_size'])
+            headers = {'Content-Disposition': 'attachment; filename="{}"'.format(name)}
+            byte_range = self.headers.get('Range')
+            if byte_range:
+                start = int(byte_range.split('=')[1].split('-')[0])
+                headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, len(data) - 1, len(data))
+                return self.reply(data[start:], status=206, headers=headers)
+            return self.reply(data, headers=headers)
+
+        self.reply(b'', status=404)
+
+
+@lru_cache(maxsize=8)
+def make_file(size):
+    return os.urandom(size)
+
+
+def start_server(handler_class, config):
+    """Starts a mock server in a daemon thread and returns it, the base URL is `server.url`."""
+    server = MockServer(handler_class, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,171 @@
+"""
+Offline benchmarks for adampy, the HDA API helpers and the Level 2 helpers of the LTPy functions notebook.
+
+adampy and the HDA helpers talk to local mock servers (see mock_servers.py), the Level 2 helpers read
+synthetic GOME-2-like HDF5 files. Every benchmark is run for several data sizes and the median latency
+and throughput are reported.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes small,medium --repeat 3 --output results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from netCDF4 import Dataset
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import adampy
+from mock_servers import start_server, MockWCSHandler, MockBrokerHandler
+from ipynb.fs.defs.ltpy_functions import load_l2_data_xr, load_masked_l2_da, load_l2_data_l3
+from ipynb.fs.defs.ltpy_hda_api_functions import init, get_access_token, launch_query, check_job_status, \
+    get_results_list, download_data, download_data_parallel
+
+SIZES = {
+    'small':  {'raster_size': 256,  'series_length': 100,  'frames': 3,  'n_files': 2, 'file_size': 1024**2,    'pixels': 10000},
+    'medium': {'raster_size': 1024, 'series_length': 365,  'frames': 7,  'n_files': 4, 'file_size': 8*1024**2,  'pixels': 100000},
+    'large':  {'raster_size': 2048, 'series_length': 1000, 'frames': 14, 'n_files': 8, 'file_size': 32*1024**2, 'pixels': 1000000},
+}
+
+TIME_T = '2019-08-18T00:00:00,2019-08-18T23:59:59'
+
+
+def make_l2_files(directory, n_files, n_pixels, seed=0):
+    """Writes GOME-2-like Level 2 files with NO2, cloud fraction and geolocation."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    for k in range(n_files):
+        with Dataset(os.path.join(directory, 'GOME_{:02d}.HDF5'.format(k)), 'w') as f:
+            f.createDimension('ground_pixel', n_pixels)
+            for group, name, values in [('GEOLOCATION', 'LatitudeCentre', rng.uniform(-90, 90, n_pixels)),
+                                        ('GEOLOCATION', 'LongitudeCentre', rng.uniform(0, 360, n_pixels)),
+                                        ('TOTAL_COLUMNS', 'NO2', rng.uniform(-1e15, 1e16, n_pixels)),
+                                        ('CLOUD_PROPERTIES', 'CloudFraction', rng.uniform(0, 1, n_pixels))]:
+                grp = f.groups[group] if group in f.groups else f.createGroup(group)
+                grp.createVariable(name, 'f4', ('ground_pixel',))[:] = values
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_case(results, name, size, func, repeat, amount, unit):
+    """Runs one benchmark and appends its median latency and throughput (amount per second) to results."""
+    row = {'benchmark': name, 'size': size}
+    try:
+        timings = measure(func, repeat)
+        median = statistics.median(timings)
+        row.update({'median_s': median, 'min_s': min(timings), 'throughput': amount / median, 'unit': unit})
+        print('{:<28} {:<7} {:>10.4f} s {:>14.2f} {}'.format(name, size, median, amount / median, unit))
+    except Exception as e:
+        row.update({'error': '{}: {}'.format(type(e).__name__, e)})
+        print('{:<28} {:<7} failed: {}'.format(name, size, row['error']))
+    results.append(row)
+
+
+def run_adampy(results, size, config, wcs, repeat):
+    endpoint = wcs.url
+    megapixels = config['raster_size']**2 / 1e6
+
+    run_case(results, 'getImage', size, lambda: adampy.getImage(
+        endpoint, 'CAMS_AOD', TIME_T, 30, 60, -10, 30, cache=False).get_data(), repeat, megapixels, 'Mpixel/s')
+    run_case(results, 'getImageSentinel2', size, lambda: adampy.getImageSentinel2(
+        endpoint, 'S2_L2A_TCI', TIME_T, 45, 46, 6, 7, mgrs_tile='32TLR', cache=False).get_data(), repeat, megapixels, 'Mpixel/s')
+    run_case(results, 'getImageSentinel5p', size, lambda: adampy.getImageSentinel5p(
+        endpoint, 'vr_S5P_OFFLNRTI_L2__CO', TIME_T, 30, 60, -10, 30, cache=False).get_data(), repeat, megapixels, 'Mpixel/s')
+    run_case(results, 'getTimeSeries', size, lambda: adampy.getTimeSeries(
+        endpoint, 'CAMS_AOD', '2019-01-01T00:00:00,2021-12-31T23:59:59', 45, 10, cache=False).get_data(),
+        repeat, config['series_length'], 'timesteps/s')
+    run_case(results, 'getTimeSeriesBatch', size, lambda: adampy.getTimeSeriesBatch(
+        endpoint, 'CAMS_AOD', '2019-01-01T00:00:00,2021-12-31T23:59:59', np.linspace(30, 60, 20), np.linspace(-10, 30, 20),
+        cache=False).get_data(), repeat, 20, 'points/s')
+
+    start_date = date(2019, 8, 1)
+    end_date = start_date + timedelta(config['frames'])
+    run_case(results, 'getAnimation', size, lambda: adampy.getAnimation(
+        endpoint, 'CAMS_AOD', start_date, end_date, 30, 60, -10, 30, cache=False).get_data(),
+        repeat, config['frames'], 'frames/s')
+    run_case(results, 'getAnimation pipelined', size, lambda: adampy.getAnimation(
+        endpoint, 'CAMS_AOD', start_date, end_date, 30, 60, -10, 30, fetch_workers=4, render_workers=4, cache=False).get_data(),
+        repeat, config['frames'], 'frames/s')
+
+
+def run_hda(results, size, config, broker, download_dir, repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+        HAPI_dict = init('EO:MOCK:DAT:SENTINEL-5P', 'mock-key', download_dir, verbose=False, apis_endpoint=broker.url)
+        HAPI_dict = get_access_token(HAPI_dict)
+        HAPI_dict = launch_query(HAPI_dict, {'datasetId': 'EO:MOCK:DAT:SENTINEL-5P'})
+        HAPI_dict = check_job_status(HAPI_dict)
+        HAPI_dict = get_results_list(HAPI_dict)
+
+    megabytes = config['n_files'] * config['file_size'] / 1024**2
+    run_case(results, 'download_data', size, lambda: download_data(HAPI_dict), repeat, megabytes, 'MB/s')
+    run_case(results, 'download_data_parallel', size, lambda: download_data_parallel(HAPI_dict, max_workers=4),
+             repeat, megabytes, 'MB/s')
+
+
+def run_l2(results, size, config, l2_dir, repeat):
+    make_l2_files(l2_dir, 4, config['pixels'])
+    megapixels = 4 * config['pixels'] / 1e6
+
+    run_case(results, 'load_l2_data_xr', size, lambda: load_l2_data_xr(
+        l2_dir, 'TOTAL_COLUMNS', 'NO2', 'LatitudeCentre', 'LongitudeCentre', 1, 'mol/cm2', 'NO2'),
+        repeat, megapixels, 'Mpixel/s')
+    run_case(results, 'load_masked_l2_da', size, lambda: load_masked_l2_da(
+        l2_dir, 'TOTAL_COLUMNS', 'NO2', 'LatitudeCentre', 'LongitudeCentre', 'NO2', 1, 'mol/cm2', 0.5, '<'),
+        repeat, megapixels, 'Mpixel/s')
+    run_case(results, 'load_l2_data_l3', size, lambda: load_l2_data_l3(
+        l2_dir, 'TOTAL_COLUMNS', 'NO2', 'LatitudeCentre', 'LongitudeCentre', 'mol/cm2', 'NO2', cell_size=0.5),
+        repeat, megapixels, 'Mpixel/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='small,medium', help='comma separated list of ' + ', '.join(SIZES))
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per benchmark')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    wcs = start_server(MockWCSHandler, {'collections': ['CAMS_AOD', 'S2_L2A_TCI', 'vr_S5P_OFFLNRTI_L2__CO']})
+    broker = start_server(MockBrokerHandler, {'polls_until_complete': 1})
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # getAnimation writes its gifs to the working directory
+        os.chdir(work_dir)
+        for size in args.sizes.split(','):
+            config = SIZES[size]
+            wcs.config.update(config)
+            broker.config.update(config)
+            run_adampy(results, size, config, wcs, args.repeat)
+            run_hda(results, size, config, broker, os.path.join(work_dir, 'downloads_' + size), args.repeat)
+            run_l2(results, size, config, os.path.join(work_dir, 'l2_' + size), args.repeat)
+        os.chdir(REPO_DIR)
+
+    wcs.shutdown()
+    broker.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()